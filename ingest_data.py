@@ -1,14 +1,17 @@
 """
 Data ingestion script to load PDFs into ChromaDB
 """
+import argparse
+import multiprocessing
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
 from src import config
 from src.data_processing import DocumentProcessor
-from src.vector_store import VectorStore
-from src.hybrid_retriever import HybridRetriever
+from src.services import get_vector_store
+from src.hybrid_retriever import build_and_save_bm25_index
 
 
 def setup_data_directories():
@@ -22,7 +25,32 @@ def setup_data_directories():
     print(f"✓ Data directories created at: {config.DATA_DIR}")
 
 
-def ingest_data():
+def positive_int(value):
+    """argparse type for options that must be a positive integer"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Load PDFs into ChromaDB")
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=None,
+        help="Number of PDFs processed in parallel (default: CPU count)"
+    )
+    parser.add_argument(
+        "--force-reindex",
+        action="store_true",
+        help="Clear the processed-PDF cache and re-run OCR/cleaning on every PDF"
+    )
+    return parser.parse_args()
+
+
+def ingest_data(workers=None, force_reindex=False):
     """Main ingestion pipeline"""
     print("="*60)
     print("Thanaweya Amma RAG - Data Ingestion")
@@ -33,7 +61,9 @@ def ingest_data():
     
     # Initialize components
     print("\n[1/4] Initializing document processor...")
-    processor = DocumentProcessor()
+    processor = DocumentProcessor(max_workers=workers)
+    if force_reindex:
+        processor.clear_cache()
     
     print("[2/4] Processing PDFs...")
     all_subject_chunks = processor.process_all_subjects()
@@ -59,7 +89,7 @@ def ingest_data():
         sys.exit(1)
     
     print(f"\n[3/4] Initializing vector store...")
-    vector_store = VectorStore()
+    vector_store = get_vector_store()
     
     # Option to reset existing collection
     stats = vector_store.get_collection_stats()
@@ -77,15 +107,19 @@ def ingest_data():
         all_chunks.extend(chunks)
     
     if all_chunks:
-        vector_store.add_documents(all_chunks)
+        # One encoding pass over every subject, then sharded inserts
+        print(f"Generating embeddings for {len(all_chunks)} documents...")
+        embeddings = vector_store.embed_documents([chunk["text"] for chunk in all_chunks])
+        vector_store.add_precomputed(all_chunks, embeddings)
     
-    # Build BM25 indices for hybrid retrieval
+    # Build BM25 indices for hybrid retrieval, one subject per worker, and save them for main.py.
+    # Workers are spawned, not forked: this process now holds torch threads, maybe a CUDA
+    # context and an open Chroma client, and forking a threaded process can deadlock the child
     print("\n[Bonus] Building BM25 indices for hybrid search...")
-    retriever = HybridRetriever(vector_store)
-    
-    for subject, chunks in all_subject_chunks.items():
-        if chunks:
-            retriever.build_bm25_index(subject, chunks)
+    subjects = [subject for subject, chunks in all_subject_chunks.items() if chunks]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+        for subject in ex.map(build_and_save_bm25_index, subjects, [all_subject_chunks[s] for s in subjects]):
+            print(f"✓ Saved BM25 index for {subject}")
     
     # Final summary
     print("\n" + "="*60)
@@ -101,8 +135,9 @@ def ingest_data():
 
 
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        ingest_data()
+        ingest_data(workers=args.workers, force_reindex=args.force_reindex)
     except KeyboardInterrupt:
         print("\n\nIngestion interrupted.")
         sys.exit(1)
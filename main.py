@@ -1,19 +1,54 @@
 """
 Main application for Thanaweya Amma RAG System
 """
+import atexit
+import re
 import sys
+from functools import lru_cache
 from pathlib import Path
 from colorama import Fore, Style, init
 
-from src.config import *
-from src.vector_store import VectorStore
-from src.hybrid_retriever import HybridRetriever
-from src.llm_client import OllamaClient
+from src import config
+from src.services import get_vector_store, get_retriever
+from src.llm_client import OllamaClient, fit_token_budget
 from src.conversation_memory import ConversationMemory
 
 # Initialize colorama for colored terminal output
 init(autoreset=True)
 
+# Set once readline is driving input(), so prompts can mark their color codes as invisible
+_READLINE_ACTIVE = False
+_RE_ANSI_ESCAPE = re.compile(r'(\x1b\[[0-9;]*m)')
+
+
+def setup_input_history():
+    """Enable arrow-key editing and persistent history for input() where readline exists"""
+    global _READLINE_ACTIVE
+    try:
+        import readline
+    except ImportError:  # e.g. Windows without pyreadline
+        return
+    # input() only goes through readline when both ends are a terminal
+    _READLINE_ACTIVE = sys.stdin.isatty() and sys.stdout.isatty()
+    try:
+        readline.read_history_file(config.HISTORY_FILE)
+    except OSError:  # No history yet
+        pass
+    readline.set_history_length(config.HISTORY_LENGTH)  # Truncate the file on write so it can't grow forever
+    atexit.register(readline.write_history_file, config.HISTORY_FILE)
+
+
+def readline_prompt(text: str) -> str:
+    """
+    Make a colored input() prompt safe for readline
+    
+    Readline counts every prompt byte as a visible column unless it is wrapped in
+    \\001...\\002, so bare ANSI color codes break cursor placement when editing.
+    """
+    if not _READLINE_ACTIVE:
+        return text
+    return _RE_ANSI_ESCAPE.sub("\001\\1\002", text)
+
 
 class ThanaweayaRAGSystem:
     """Main RAG system orchestrator"""
@@ -26,14 +61,17 @@ class ThanaweayaRAGSystem:
         
         # Initialize vector store
         print(f"{Fore.YELLOW}[1/3] Initializing vector store...")
-        self.vector_store = VectorStore()
+        self.vector_store = get_vector_store()
         stats = self.vector_store.get_collection_stats()
         print(f"{Fore.GREEN}✓ Vector store ready: {stats['total_documents']} documents indexed\n")
         
         # Initialize hybrid retriever
         print(f"{Fore.YELLOW}[2/3] Initializing hybrid retriever...")
-        self.retriever = HybridRetriever(self.vector_store)
-        print(f"{Fore.GREEN}✓ Hybrid retriever ready\n")
+        self.retriever = get_retriever()
+        loaded = self.retriever.load_bm25_indices()
+        if not loaded:
+            print(f"{Fore.RED}⚠ No BM25 indices found, using semantic search only. Run 'python ingest_data.py' to build them.")
+        print(f"{Fore.GREEN}✓ Hybrid retriever ready: BM25 indices for {len(loaded)} subjects\n")
         
         # Initialize LLM client
         print(f"{Fore.YELLOW}[3/3] Connecting to Ollama...")
@@ -67,7 +105,7 @@ class ThanaweayaRAGSystem:
         
         while True:
             try:
-                choice = input(f"\n{Fore.WHITE}Select subject (1-{len(config.SUBJECTS)}) or 'q' to quit: ").strip()
+                choice = input(readline_prompt(f"\n{Fore.WHITE}Select subject (1-{len(config.SUBJECTS)}) or 'q' to quit: ")).strip()
                 
                 if choice.lower() == 'q':
                     print(f"{Fore.RED}Exiting...")
@@ -100,7 +138,7 @@ class ThanaweayaRAGSystem:
         modes = {"1": "ask", "2": "quiz", "3": "explain"}
         
         while True:
-            choice = input(f"\n{Fore.WHITE}Select mode (1-3): ").strip()
+            choice = input(readline_prompt(f"\n{Fore.WHITE}Select mode (1-3): ")).strip()
             
             if choice in modes:
                 mode = modes[choice]
@@ -126,7 +164,7 @@ class ThanaweayaRAGSystem:
         
         while True:
             # Get user input
-            user_input = input(f"{Fore.GREEN}You: {Style.RESET_ALL}").strip()
+            user_input = input(readline_prompt(f"{Fore.GREEN}You: {Style.RESET_ALL}")).strip()
             
             if not user_input:
                 continue
@@ -155,8 +193,10 @@ class ThanaweayaRAGSystem:
             context_docs = self.retriever.search(
                 query=user_input,
                 subject=self.current_subject,
-                top_k=config.TOP_K_RETRIEVAL
+                top_k=config.CONTEXT_CANDIDATES
             )
+            # Keep as many of the best chunks as fit the prompt's token budget
+            context_docs = fit_token_budget(context_docs)
             
             if not context_docs:
                 print(f"{Fore.RED}⚠ No relevant content found for your query.\n")
@@ -207,6 +247,12 @@ class ThanaweayaRAGSystem:
             sys.exit(1)
 
 
+@lru_cache(maxsize=1)
+def get_system() -> ThanaweayaRAGSystem:
+    """Build the RAG system once and reuse it on later calls in the same process"""
+    return ThanaweayaRAGSystem()
+
+
 def main():
     """Entry point"""
     # Check if ChromaDB has data
@@ -219,7 +265,8 @@ def main():
         sys.exit(1)
     
     # Run the system
-    system = ThanaweayaRAGSystem()
+    setup_input_history()
+    system = get_system()
     system.run()
 
 
@@ -8,6 +8,10 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).parent.parent  # Go up from src/ to project root
 DATA_DIR = PROJECT_ROOT / "data"
 CHROMA_DIR = PROJECT_ROOT / "chroma_db"
+CACHE_DIR = PROJECT_ROOT / ".cache"  # Processed chunks per PDF, keyed by file hash
+BM25_INDEX_DIR = PROJECT_ROOT / "bm25_index"  # One persisted BM25 index per subject
+HISTORY_FILE = Path.home() / ".thanaweya_history"  # Input history for the chat prompt
+HISTORY_LENGTH = 1000  # Input lines kept in the history file
 
 # Subjects
 SUBJECTS = ["arabic", "math", "chemistry", "biology", "english", "physics"]
@@ -16,24 +20,60 @@ SUBJECTS = ["arabic", "math", "chemistry", "biology", "english", "physics"]
 CHROMA_COLLECTION_NAME = "thanaweya_amma_docs"
 EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # Supports Arabic
 EMBEDDING_DIMENSION = 384
+EMBEDDING_BATCH_SIZE = 256  # Chunks per encoder forward pass
+CHROMA_INSERT_BATCH_SIZE = 5000  # Chunks per collection.add call (below Chroma's max batch size)
+
+# HNSW index settings, applied when the collection is created
+CHROMA_HNSW_SETTINGS = {
+    "hnsw:space": "cosine",       # Embeddings are normalized, so cosine ranks like inner product
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,         # Candidates explored per query; the main recall/latency knob
+    "hnsw:M": 32,
+    "hnsw:batch_size": 1000,      # Vectors buffered before one bulk insert into the graph
+    "hnsw:sync_threshold": 5000   # Vectors added between index writes to disk
+}
 
 # Document Chunking
 CHUNK_SIZE = 600  # Characters
 CHUNK_OVERLAP = 200  # Characters overlap between chunks
 
+# OCR
+OCR_WORKERS = 4  # Threads running Tesseract on the pages of one PDF (fewer when PDFs run in parallel)
+OCR_PAGE_BATCH_SIZE = 50  # Pages rendered and held in memory at a time
+OCR_SCALE = 1.5  # Render zoom for OCR (1.0 = 72 DPI), grayscale
+OCR_FALLBACK_SCALE = 2.0  # Zoom used to retry pages that came back (nearly) empty
+OCR_MIN_TEXT_CHARS = 50  # Pages with less text than this are OCR'd / retried
+
+# Bump whenever extraction, cleaning or chunking changes so cached chunks are rebuilt
+PROCESSING_CACHE_VERSION = 4
+
 # Ollama Configuration
 OLLAMA_MODEL = "llama3.1:8b"
 OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_TEMPERATURE = 0.7
 OLLAMA_MAX_TOKENS = 2000
+MAX_CONTEXT_TOKENS = 1500  # Budget for retrieved chunks in the prompt (~5 full Arabic or ~10 English chunks)
+# Token estimate without a tokenizer: Arabic script splits into far more tokens per character than English
+CHARS_PER_TOKEN = 4
+ARABIC_CHARS_PER_TOKEN = 2
 
 # Retrieval Configuration
 TOP_K_RETRIEVAL = 5  # Number of chunks to retrieve
+CONTEXT_CANDIDATES = 10  # Chunks retrieved per question; MAX_CONTEXT_TOKENS decides how many reach the prompt
+QUERY_EMBEDDING_CACHE_SIZE = 256  # Recent query embeddings kept in memory
+SEARCH_CACHE_SIZE = 256  # Recent hybrid search results kept for repeated questions
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Cosine similarity above which a cached query's results are reused
 HYBRID_SEARCH_WEIGHTS = {
     "semantic": 0.6,  # Weight for semantic/embedding search
     "bm25": 0.4       # Weight for BM25 lexical search
 }
 
+# Cross-encoder reranking of the fused candidates
+USE_RERANKER = True
+RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"  # Multilingual (Arabic included); ~2.3 GB download on first start
+RERANK_CANDIDATES = 32  # Fused results passed to the cross-encoder
+RERANK_BATCH_SIZE = 16
+
 # Conversation Memory
 MAX_MEMORY_MESSAGES = 3  # Last 3 messages (user + assistant pairs)
 
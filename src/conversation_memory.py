@@ -1,11 +1,17 @@
 """
 Conversation memory to maintain last N messages
 """
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional
 from collections import deque
 from . import config
 
 
+class Turn(NamedTuple):
+    """One user-assistant interaction"""
+    user: str
+    assistant: str
+
+
 class ConversationMemory:
     """Manages conversation history with a sliding window"""
     
@@ -18,6 +24,7 @@ class ConversationMemory:
         """
         self.max_messages = max_messages
         self.messages = deque(maxlen=max_messages)
+        self._cached_history: Optional[str] = None  # Formatted history, rebuilt after changes
     
     def add_interaction(self, user_message: str, assistant_message: str):
         """
@@ -27,10 +34,8 @@ class ConversationMemory:
             user_message: The user's message
             assistant_message: The assistant's response
         """
-        self.messages.append({
-            "user": user_message,
-            "assistant": assistant_message
-        })
+        self.messages.append(Turn(user_message, assistant_message))
+        self._cached_history = None
     
     def get_formatted_history(self) -> str:
         """
@@ -39,15 +44,12 @@ class ConversationMemory:
         Returns:
             Formatted string of conversation history
         """
-        if not self.messages:
-            return ""
-        
-        history_parts = []
-        for i, interaction in enumerate(self.messages, 1):
-            history_parts.append(f"User: {interaction['user']}")
-            history_parts.append(f"Assistant: {interaction['assistant']}")
-        
-        return "\n".join(history_parts)
+        if self._cached_history is None:
+            self._cached_history = "\n".join(
+                f"User: {turn.user}\nAssistant: {turn.assistant}"
+                for turn in self.messages
+            )
+        return self._cached_history
     
     def get_messages(self) -> List[Dict]:
         """
@@ -56,11 +58,12 @@ class ConversationMemory:
         Returns:
             List of message dictionaries
         """
-        return list(self.messages)
+        return [turn._asdict() for turn in self.messages]
     
     def clear(self):
         """Clear all conversation history"""
         self.messages.clear()
+        self._cached_history = None
     
     def is_empty(self) -> bool:
         """Check if memory is empty"""
@@ -3,12 +3,17 @@ Enhanced data processing with OCR and Structure-Aware Chunking
 """
 import fitz  # PyMuPDF
 from pathlib import Path
-from typing import List, Dict, Optional, Protocol
+from typing import Iterator, List, Dict, Optional, Protocol, Tuple
 from PIL import Image
 import io
+import os
+import hashlib
+import pickle
 import shutil
 import re
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 from . import config
 
 # Try to import OCR capability
@@ -21,31 +26,55 @@ try:
             pytesseract.pytesseract.tesseract_cmd = default_path
             print(f"✓ Found Tesseract at: {default_path}")
         else:
-            print("⚠ Tesseract not found in PATH or default location")
+            # Without the binary every OCR call would fail and cache empty pages as if read
+            OCR_AVAILABLE = False
+            print("⚠ Tesseract not found in PATH or default location, OCR disabled")
 except ImportError:
     OCR_AVAILABLE = False
     print("Warning: pytesseract not available.")
 
 # --- CLEANING STRATEGIES ---
 
+# Patterns are compiled once at import time; the cleaners run them over every line of every book
+_RE_JUNK_LINE = re.compile(
+    r'^[^\S\n]*'
+    r'(?:'
+    r'|\d{1,3}'                        # Page numbers
+    r'|(?![.!?][^\S\n]*$)\S{1,2}'      # Noise (a lone '.', '!' or '?' is kept)
+    r'|[-_=]{3,}[^\n]*'                # Underscore/dash lines
+    r'|[—–]{3,}'
+    r'|[-=_](?:[-=_]|[^\S\n])*'        # Lines with just separators
+    r')[^\S\n]*(?:\n|$)',
+    re.MULTILINE
+)
+_RE_ISO_LETTER = re.compile(r'\s[a-zA-Z]\s')
+_RE_ARABIC_PUNCT = re.compile(r'\s+([،؛؟])')
+_RE_FIG = re.compile(r'^Fig\.?\s*\d+.*$', re.MULTILINE)
+_RE_FIG_SCI = re.compile(r'^(Fig|Shape|Figure)\.?\s*\(?\d+\)?.*$', re.MULTILINE | re.IGNORECASE)
+_RE_SINGLE_CAPITAL = re.compile(r'^\s*[A-Z]\s*$', re.MULTILINE)
+_RE_BULLET = re.compile(r'^\s*[·•●]\s*', re.MULTILINE)
+_RE_WS = re.compile(r'[ \t]+')
+_RE_MCQ_OPTION = re.compile(r'\s+([A-D]\.)\s+')
+
+# Standard Arabic block; text layers with only presentation forms (FB50-FEFF) still need OCR
+_RE_ARABIC_LETTER = re.compile(r'[\u0600-\u06ff]')
+
+# Paragraph reconstruction
+_RE_LINE_EDGE_WS = re.compile(r'^[^\S\n]+|[^\S\n]+$', re.MULTILINE)
+_RE_SOFT_WRAP = re.compile(r'(?<![.:!?؟\n])\n(?!\n)')  # Line break inside a paragraph
+_RE_LINE_BREAK = re.compile(r'(?<!\n)\n(?!\n)')        # Remaining single breaks end a paragraph
+_RE_BLANK_RUN = re.compile(r'\n{3,}')
+
+# Chunk break points, in order of preference: paragraph, line, sentence, word
+_RE_SPLIT_POINT = re.compile(r'(\n\n+)|(\n)|(\. )|( )')
+
 class TextCleaner(Protocol):
     def clean(self, text: str) -> str: pass
 
 class BaseCleaner:
     def basic_clean(self, text: str) -> str:
-        # Basic garbage removal before restructuring
-        lines = text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            s = line.strip()
-            if not s:
-                continue
-            if s.isdigit() and len(s) < 4: continue # Page numbers
-            if len(s) < 3 and not s in ['.', '!', '?']: continue # Noise
-            if re.match(r'^[-_=]{3,}|^[—–]{3,}$', s): continue # Underscore/dash lines
-            if re.match(r'^[-=_\s]+$', s): continue # Lines with just separators
-            cleaned_lines.append(line)
-        return "\n".join(cleaned_lines)
+        # Basic garbage removal before restructuring: drop every junk line in one regex pass
+        return _RE_JUNK_LINE.sub('', text).rstrip('\n')
 
 class ArabicCleaner(BaseCleaner):
     def clean(self, text: str) -> str:
@@ -55,33 +84,33 @@ class ArabicCleaner(BaseCleaner):
         filtered_lines = []
         for line in lines:
             if line.count('|') > 2 or line.count('_') > 5: continue
-            line = re.sub(r'\s[a-zA-Z]\s', ' ', line) # Isolated letters
+            line = _RE_ISO_LETTER.sub(' ', line) # Isolated letters
             filtered_lines.append(line)
         text = '\n'.join(filtered_lines)
-        text = re.sub(r'\s+([،؛؟])', r'\1', text)
+        text = _RE_ARABIC_PUNCT.sub(r'\1', text)
         return text
 
 class MathPhysicsCleaner(BaseCleaner):
     def clean(self, text: str) -> str:
         text = self.basic_clean(text)
-        text = re.sub(r'^Fig\.?\s*\d+.*$', '', text, flags=re.MULTILINE)
+        text = _RE_FIG.sub('', text)
         for op in ['=', '+', '-', '×', '÷']:
             text = text.replace(op, f" {op} ")
-        text = re.sub(r'[ \t]+', ' ', text)
+        text = _RE_WS.sub(' ', text)
         return text
 
 class ScienceCleaner(BaseCleaner):
     def clean(self, text: str) -> str:
         text = self.basic_clean(text)
-        text = re.sub(r'^(Fig|Shape|Figure)\.?\s*\(?\d+\)?.*$', '', text, flags=re.MULTILINE|re.IGNORECASE)
-        text = re.sub(r'^\s*[A-Z]\s*$', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\s*[·•●]\s*', '- ', text, flags=re.MULTILINE)
+        text = _RE_FIG_SCI.sub('', text)
+        text = _RE_SINGLE_CAPITAL.sub('', text)
+        text = _RE_BULLET.sub('- ', text)
         return text
 
 class EnglishCleaner(BaseCleaner):
     def clean(self, text: str) -> str:
         text = self.basic_clean(text)
-        text = re.sub(r'\s+([A-D]\.)\s+', r'\n\1 ', text)
+        text = _RE_MCQ_OPTION.sub(r'\n\1 ', text)
         return text
 
 # --- STRUCTURE AWARE CHUNKING ---
@@ -89,12 +118,9 @@ class EnglishCleaner(BaseCleaner):
 class DocumentStructureChunker:
     """Chunks documents based on structural separators (Lessons, Chapters, etc.)"""
     
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=600,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+    def __init__(self, chunk_size: int = config.CHUNK_SIZE, chunk_overlap: int = config.CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         
         # Define structural separators for different languages/subjects
         self.separators = [
@@ -105,57 +131,76 @@ class DocumentStructureChunker:
             r"^(الباب|الفصل|الدرس|الوحدة|المحاضرة)\s+(الأول|الثاني|الثالث|الرابع|الخامس|السادس|السابع|الثامن|التاسع|عشر|\d+)",
             r"^\d+\s*-\s*", # Numbered sections like "1 - Introduction"
         ]
+        # One multiline alternation of all separators matching whole header lines.
+        # \s is narrowed to horizontal whitespace so a header can't span two lines.
+        self._header_line_re = re.compile(
+            "(?:" + "|".join("(?:" + sep.replace(r"\s", r"[^\S\n]") + ")" for sep in self.separators) + r")[^\n]*",
+            re.IGNORECASE | re.MULTILINE
+        )
 
     def _reconstruct_paragraphs(self, text: str) -> str:
         """Merge lines that shouldn't be broken (Paragraph Reconstruction)"""
-        lines = text.split('\n')
-        reconstructed = []
-        current_para = []
+        text = _RE_LINE_EDGE_WS.sub('', text)
+        # Headers always stand alone (Don't merge headers!)
+        text = self._header_line_re.sub(lambda m: f"\n\n{m.group(0)}\n\n", text)
+        # Heuristic: a line ending with period/colon ends the paragraph, any other break is a wrap
+        text = _RE_SOFT_WRAP.sub(' ', text)
+        text = _RE_LINE_BREAK.sub('\n\n', text)
+        return _RE_BLANK_RUN.sub('\n\n', text).strip('\n')
+
+    def _fast_split(self, text: str) -> List[str]:
+        """
+        Split text into chunks of at most chunk_size characters, overlapping by up to chunk_overlap
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if current_para:
-                    reconstructed.append(" ".join(current_para))
-                    current_para = []
-                continue
-            
-            # Check if this line looks like a header (Don't merge headers!)
-            is_header = any(re.search(sep, line, re.IGNORECASE) for sep in self.separators)
-            if is_header:
-                if current_para:
-                    reconstructed.append(" ".join(current_para))
-                    current_para = []
-                reconstructed.append(f"\n\n{line}\n\n") # Force separation
-                continue
-
-            current_para.append(line)
-            
-            # Heuristic: If line ends with period/colon, it might be end of para
-            if line.endswith(('.', ':', '!', '?', '؟')):
-                reconstructed.append(" ".join(current_para))
-                current_para = []
-                
-        if current_para:
-            reconstructed.append(" ".join(current_para))
-            
-        return "\n\n".join(reconstructed)
+        Break points are found in one regex scan. Each chunk ends at the best one in the
+        second half of its window: paragraph, then line, then sentence, then word.
+        """
+        size, overlap = self.chunk_size, self.chunk_overlap
+        by_kind = ([], [], [], [])  # End offsets of paragraph, line, sentence and word breaks
+        all_breaks = []
+        for m in _RE_SPLIT_POINT.finditer(text):
+            by_kind[m.lastindex - 1].append(m.end())
+            all_breaks.append(m.end())
+        
+        chunks = []
+        start, n = 0, len(text)
+        while start < n:
+            limit = start + size
+            end = n if limit >= n else limit
+            if limit < n:
+                for breaks in by_kind:
+                    i = bisect_right(breaks, limit) - 1
+                    if i >= 0 and breaks[i] > start + size // 2:
+                        end = breaks[i]
+                        break
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= n:
+                break
+            # Next chunk starts at the first break inside the overlap window
+            j = bisect_left(all_breaks, end - overlap)
+            next_start = all_breaks[j] if j < len(all_breaks) and all_breaks[j] < end else end
+            start = next_start if next_start > start else end
+        return chunks
 
     def split_text(self, text: str) -> List[str]:
         # 1. Reconstruct broken paragraphs first
         clean_struct_text = self._reconstruct_paragraphs(text)
         
-        # 2. Split by major sections first (using double newlines inserted by reconstructor)
-        # Actually, RecursiveCharacterTextSplitter handles this if we give it the right separators
-        # But we want to ensure headers start new chunks if possible.
-        
-        return self.text_splitter.split_text(clean_struct_text)
+        # 2. Split at paragraph breaks where possible (headers are their own paragraphs
+        # after reconstruction, so they tend to start new chunks)
+        return self._fast_split(clean_struct_text)
 
 # --- PIPELINE ---
 
 class DocumentProcessor:
-    def __init__(self, use_ocr: bool = True):
+    def __init__(self, use_ocr: bool = True, max_workers: Optional[int] = None,
+                 ocr_workers: int = config.OCR_WORKERS):
         self.use_ocr = use_ocr and OCR_AVAILABLE
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.ocr_workers = ocr_workers
+        self.ocr_failures = 0  # Pages of the last PDF that Tesseract failed on
         self.chunker = DocumentStructureChunker()
         self.cleaners = {
             'arabic': ArabicCleaner(),
@@ -169,33 +214,86 @@ class DocumentProcessor:
     def get_cleaner(self, subject: str) -> TextCleaner:
         return self.cleaners.get(subject.lower(), EnglishCleaner())
     
+    def render_page(self, page: fitz.Page, scale: float = config.OCR_SCALE) -> Tuple[bytes, Tuple[int, int]]:
+        """Render a page to raw grayscale pixels (samples, (width, height)) for OCR"""
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+        return pix.samples, (pix.width, pix.height)
+
     def extract_text_with_ocr(self, page: fitz.Page, lang: str = 'ara+eng') -> str:
         try:
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            return pytesseract.image_to_string(img, lang=lang)
+            samples, size = self.render_page(page)
+            return _ocr_one((samples, size, lang)) or ""
         except Exception: return ""
 
-    def process_pdf(self, pdf_path: Path, subject: str) -> str:
+    def iter_pages(self, pdf_path: Path, subject: str) -> Iterator[str]:
+        """Yield the text of each page in order, OCR'ing pages in batches to bound memory"""
         doc = fitz.open(pdf_path)
-        full_text = ""
         print(f"    - Processing {pdf_path.name} ({len(doc)} pages)")
-        for i, page in enumerate(doc):
-            text = page.get_text()
-            needs_ocr = len(text.strip()) < 50 or subject == 'arabic'
-            if needs_ocr and self.use_ocr:
-                lang = 'ara+eng' if subject == 'arabic' else 'eng'
-                text = self.extract_text_with_ocr(page, lang)
-            full_text += f"\n{text}"
-            if (i+1) % 20 == 0: print(f"      Running OCR on page {i+1}...")
-        doc.close()
+        lang = 'ara+eng' if subject == 'arabic' else 'eng'
+        batch_size = config.OCR_PAGE_BATCH_SIZE
+        min_chars = config.OCR_MIN_TEXT_CHARS
+        self.ocr_failures = 0
+        if self.ocr_workers > 1:
+            _limit_tesseract_threads()  # Several Tesseract runs at once already fill the cores
+        try:
+            with ThreadPoolExecutor(max_workers=self.ocr_workers) as ex:
+                for start in range(0, len(doc), batch_size):
+                    texts = []
+                    ocr_jobs = []  # (batch_index, samples, size)
+                    # PyMuPDF is not thread-safe, so pages are read and rendered here sequentially
+                    for i in range(start, min(start + batch_size, len(doc))):
+                        page = doc[i]
+                        text = page.get_text()
+                        needs_ocr = len(text.strip()) < min_chars or (subject == 'arabic' and not _has_real_arabic(text))
+                        if needs_ocr and self.use_ocr:
+                            try:
+                                ocr_jobs.append((len(texts), *self.render_page(page)))
+                            except Exception: pass
+                        texts.append(text)
+                    if ocr_jobs:
+                        # Tesseract releases the GIL, so pages are OCR'd concurrently
+                        print(f"      Running OCR on {len(ocr_jobs)} pages ({start+1}-{start+len(texts)})...")
+                        ocr_texts = ex.map(_ocr_one, [(samples, size, lang) for _, samples, size in ocr_jobs])
+                        retry_jobs = []
+                        failed = set()  # Pages Tesseract errored on; their text layer is kept meanwhile
+                        for (i, _, _), text in zip(ocr_jobs, ocr_texts):
+                            if text is None:
+                                failed.add(i)
+                            else:
+                                texts[i] = text
+                            if text is None or len(text.strip()) < min_chars:
+                                try:
+                                    retry_jobs.append((i, *self.render_page(doc[start + i], config.OCR_FALLBACK_SCALE)))
+                                except Exception: pass
+                        # Pages the low-resolution render couldn't read are retried at full resolution
+                        retry_texts = ex.map(_ocr_one, [(samples, size, lang) for _, samples, size in retry_jobs])
+                        for (i, _, _), text in zip(retry_jobs, retry_texts):
+                            if text is None:
+                                continue
+                            if i in failed or len(text.strip()) > len(texts[i].strip()):
+                                texts[i] = text
+                            failed.discard(i)
+                        self.ocr_failures += len(failed)
+                    yield from texts
+        finally:
+            doc.close()
+        if self.ocr_failures:
+            print(f"      ⚠ OCR failed on {self.ocr_failures} pages (is Tesseract's '{lang}' language data installed?)")
+
+    def process_pdf(self, pdf_path: Path, subject: str) -> str:
+        buf = io.StringIO()
+        for i, text in enumerate(self.iter_pages(pdf_path, subject)):
+            if i: buf.write("\n")
+            buf.write(text)
         cleaner = self.get_cleaner(subject)
-        return cleaner.clean(full_text)
+        return cleaner.clean(buf.getvalue())
 
     def process_element_chunks(self, text: str, pdf_file: Path, subject: str) -> List[Dict]:
         """Process text into chunks"""
         chunks = self.chunker.split_text(text)
+        # Per-file metadata strings are built once and shared by every chunk of the file,
+        # which also lets pickle (worker results, chunk cache) store them only once
+        filename, source = pdf_file.name, str(pdf_file)
         doc_chunks = []
         for idx, chunk_text in enumerate(chunks):
             if len(chunk_text.strip()) < 50: continue
@@ -203,35 +301,142 @@ class DocumentProcessor:
                 "text": chunk_text,
                 "metadata": {
                     "subject": subject, 
-                    "filename": pdf_file.name, 
-                    "source": str(pdf_file),
+                    "filename": filename, 
+                    "source": source,
                     "chunk_id": idx
                 }
             })
         return doc_chunks
 
-    def process_subject_pdfs(self, subject: str) -> List[Dict]:
+    def clear_cache(self):
+        """Delete all cached chunks so every PDF is processed again"""
+        shutil.rmtree(config.CACHE_DIR, ignore_errors=True)
+        print(f"✓ Cleared processing cache at: {config.CACHE_DIR}")
+
+    def _list_pdfs(self, subject: str) -> List[Path]:
         subject_dir = config.DATA_DIR / subject
         if not subject_dir.exists(): return []
-        all_chunks = []
-        for pdf_file in subject_dir.glob("*.pdf"):
-            try:
-                text = self.process_pdf(pdf_file, subject)
-                print("      Chunking by structure...")
-                doc_chunks = self.process_element_chunks(text, pdf_file, subject)
-                all_chunks.extend(doc_chunks)
-                print(f"    ✓ Created {len(doc_chunks)} structure-aware chunks")
-            except Exception as e:
-                print(f"    ✗ Error: {e}")
-                import traceback; traceback.print_exc()
-        return all_chunks
+        return sorted(subject_dir.glob("*.pdf"))
+
+    def _process_jobs(self, jobs: List[Tuple[str, Path]]) -> Dict[str, List[Dict]]:
+        """Run (subject, pdf_file) jobs, in a process pool when more than one worker is allowed"""
+        results = {subject: [] for subject, _ in jobs}
+        if not jobs: return results
+        if self.max_workers == 1 or len(jobs) == 1:
+            for subject, pdf_file in jobs:
+                try:
+                    doc_chunks = _process_one_pdf(pdf_file, subject, self.use_ocr, self.ocr_workers)
+                    results[subject].extend(doc_chunks)
+                    print(f"    ✓ Created {len(doc_chunks)} structure-aware chunks")
+                except Exception as e:
+                    print(f"    ✗ Error: {e}")
+                    import traceback; traceback.print_exc()
+            return results
+        # Split the cores between the PDF processes instead of giving each a full OCR pool
+        processes = min(self.max_workers, len(jobs))
+        ocr_workers = max(1, min(self.ocr_workers, (os.cpu_count() or 1) // processes))
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_pdf_worker) as ex:
+            futures = {ex.submit(_process_one_pdf, pdf_file, subject, self.use_ocr, ocr_workers): (subject, pdf_file)
+                       for subject, pdf_file in jobs}
+            with tqdm(total=len(futures), desc="PDFs") as progress:
+                for future in as_completed(futures):
+                    subject, pdf_file = futures[future]
+                    try:
+                        doc_chunks = future.result()
+                        results[subject].extend(doc_chunks)
+                        tqdm.write(f"    ✓ {subject}/{pdf_file.name}: {len(doc_chunks)} structure-aware chunks")
+                    except Exception as e:
+                        tqdm.write(f"    ✗ {subject}/{pdf_file.name}: {e}")
+                        import traceback; traceback.print_exc()
+                    progress.update(1)
+        return results
+
+    def process_subject_pdfs(self, subject: str) -> List[Dict]:
+        jobs = [(subject, pdf_file) for pdf_file in self._list_pdfs(subject)]
+        return self._process_jobs(jobs).get(subject, [])
 
     def process_all_subjects(self) -> Dict[str, List[Dict]]:
-        all_data = {}
+        jobs = []
         for subject in config.SUBJECTS:
-            print(f"\nSubject: {subject.upper()}")
-            all_data[subject] = self.process_subject_pdfs(subject)
-        return all_data
+            pdf_files = self._list_pdfs(subject)
+            print(f"Subject: {subject.upper()} ({len(pdf_files)} PDFs)")
+            jobs.extend((subject, pdf_file) for pdf_file in pdf_files)
+        results = self._process_jobs(jobs)
+        return {subject: results.get(subject, []) for subject in config.SUBJECTS}
+
+
+def _has_real_arabic(text: str) -> bool:
+    """Whether a page's text layer holds usable Arabic (not presentation forms or broken glyphs)"""
+    return len(_RE_ARABIC_LETTER.findall(text)) > 20 and text.count('\ufffd') < 5
+
+
+def _ocr_one(job: Tuple[bytes, Tuple[int, int], str]) -> Optional[str]:
+    """Run Tesseract on one rendered page; None if Tesseract failed (unlike an empty page)"""
+    # pytesseract still saves the image to a temporary PNG for the tesseract CLI; passing
+    # raw samples only drops PyMuPDF's PNG encode and PIL's decode of it
+    samples, size, lang = job
+    try:
+        img = Image.frombytes("L", size, samples)
+        return pytesseract.image_to_string(img, lang=lang)
+    except Exception: return None
+
+
+def _pdf_cache_path(pdf_path: Path, subject: str, use_ocr: bool) -> Path:
+    """Cache file for a PDF's chunks, keyed by its content, the processing version and the settings that shape the chunks"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(
+        f"v{config.PROCESSING_CACHE_VERSION}-ocr{int(use_ocr)}"
+        f"-chunk{config.CHUNK_SIZE}/{config.CHUNK_OVERLAP}"
+        f"-scale{config.OCR_SCALE}/{config.OCR_FALLBACK_SCALE}-min{config.OCR_MIN_TEXT_CHARS}".encode()
+    )
+    return config.CACHE_DIR / f"{subject}_{digest.hexdigest()}.pkl"
+
+
+def _limit_tesseract_threads():
+    """Limit each Tesseract run to one OpenMP thread, unless the user set OMP_THREAD_LIMIT"""
+    # pytesseract hands os.environ itself to the tesseract subprocess, so this applies to every later run
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _init_pdf_worker():
+    """Process pool initializer: the worker processes already use every core"""
+    _limit_tesseract_threads()
+
+
+def _process_one_pdf(pdf_path: Path, subject: str, use_ocr: bool = True,
+                     ocr_workers: int = config.OCR_WORKERS) -> List[Dict]:
+    """Extract, clean and chunk a single PDF (module-level so worker processes can pickle it)"""
+    cache_path = _pdf_cache_path(pdf_path, subject, use_ocr)
+    if cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                doc_chunks = pickle.load(f)
+            # The same content may have been cached under another file name
+            filename, source = pdf_path.name, str(pdf_path)
+            for chunk in doc_chunks:
+                chunk["metadata"].update(filename=filename, source=source)
+            print(f"    - Using cached chunks for {pdf_path.name}")
+            return doc_chunks
+        except Exception as e:
+            print(f"    ⚠ Ignoring unreadable cache for {pdf_path.name}: {e}")
+
+    processor = DocumentProcessor(use_ocr=use_ocr, max_workers=1, ocr_workers=ocr_workers)
+    text = processor.process_pdf(pdf_path, subject)
+    doc_chunks = processor.process_element_chunks(text, pdf_path, subject)
+    if processor.ocr_failures:
+        # Failures may be fixed by installing language data, so don't freeze the missing text
+        print(f"    ⚠ Not caching {pdf_path.name}; failed pages are retried on the next run")
+        return doc_chunks
+
+    config.CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(doc_chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return doc_chunks
 
 if __name__ == "__main__":
     processor = DocumentProcessor()
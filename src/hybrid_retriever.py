@@ -2,25 +2,107 @@
 Hybrid retrieval combining BM25 (lexical) and semantic search
 """
 from rank_bm25 import BM25Okapi
-from typing import List, Dict
+from pathlib import Path
+from typing import Any, List, Dict
+import os
+import pickle
+import struct
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from . import config
 
 
+# Reused across searches so no thread is created per query
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid-search")
+
+# Bump when the persisted index layout or the tokenization changes
+_INDEX_FORMAT_VERSION = 5
+
+# Arabic normalization for BM25 terms: drop tashkeel and tatweel, unify alef/yeh/teh marbuta forms
+_AR_NORMALIZE = str.maketrans({
+    "\u064b": "", "\u064c": "", "\u064d": "", "\u064e": "",  # tanween, fatha
+    "\u064f": "", "\u0650": "", "\u0651": "", "\u0652": "",  # damma, kasra, shadda, sukun
+    "\u0640": "",  # tatweel (kashida)
+    "أ": "ا", "إ": "ا", "آ": "ا",
+    "ى": "ي",
+    "ة": "ه"
+})
+
+
+class PostingsBM25(BM25Okapi):
+    """
+    BM25Okapi scored through an inverted index
+    
+    rank_bm25 scores a query term by looking it up in every document's term dict, in Python.
+    Here the postings (term -> doc ids, term frequencies) are built once in CSR form, so a
+    query only touches the documents that actually contain its terms.
+    """
+    
+    def __init__(self, corpus: List[List[str]], **kwargs):
+        super().__init__(corpus, **kwargs)
+        
+        term_ids = {}
+        rows, docs, freqs = [], [], []
+        for doc_id, doc_freqs in enumerate(self.doc_freqs):
+            for term, freq in doc_freqs.items():
+                rows.append(term_ids.setdefault(term, len(term_ids)))
+                docs.append(doc_id)
+                freqs.append(freq)
+        
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind="stable")  # Keeps doc ids ascending within a term
+        self.term_ids = term_ids
+        self.indptr = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(term_ids)), out=self.indptr[1:])
+        self.post_docs = np.asarray(docs, dtype=np.int32)[order]
+        self.post_freqs = np.asarray(freqs, dtype=np.float32)[order]
+        self.doc_len = np.asarray(self.doc_len, dtype=np.float32)
+        self.doc_freqs = None  # Superseded by the postings
+        
+        # Query-independent parts of the BM25 formula, computed once:
+        # idf * (k1 + 1) per term and k1 * (1 - b + b * doc_len / avgdl) per document
+        idf = np.zeros(len(term_ids), dtype=np.float32)
+        for term, row in term_ids.items():
+            idf[row] = self.idf[term]
+        self.term_weights = idf * np.float32(self.k1 + 1)
+        self.idf = None  # Folded into term_weights (indexed through term_ids)
+        self.denom_base = (self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)).astype(np.float32)
+    
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        score = np.zeros(self.corpus_size, dtype=np.float32)
+        for q in query:
+            row = self.term_ids.get(q)
+            if row is None:
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            docs = self.post_docs[start:end]
+            freqs = self.post_freqs[start:end]
+            score[docs] += self.term_weights[row] * freqs / (freqs + self.denom_base[docs])
+        return score
+    
+    def get_batch_scores(self, query: List[str], doc_ids: List[int]) -> List[float]:
+        return self.get_scores(query)[doc_ids].tolist()
+
+
 class HybridRetriever:
     """Hybrid retriever combining BM25 and semantic search"""
     
-    def __init__(self, vector_store):
+    def __init__(self, vector_store, reranker=None):
         """
         Initialize hybrid retriever
         
         Args:
             vector_store: VectorStore instance for semantic search
+            reranker: Optional CrossEncoderReranker applied to the fused results
         """
         self.vector_store = vector_store
+        self.reranker = reranker
         self.bm25_indices = {}  # Subject -> BM25 index
-        self.corpus_docs = {}   # Subject -> List of documents
+        # Subject -> chunk texts / metadata dicts, parallel to the BM25 document order
+        self.corpus_texts = {}
+        self.corpus_meta = {}
+        self._search_cache = OrderedDict()  # (query, subject, top_k) -> (query embedding, results), LRU
     
     def build_bm25_index(self, subject: str, documents: List[Dict]):
         """
@@ -35,14 +117,74 @@ class HybridRetriever:
             return
         
         # Tokenize documents (simple whitespace tokenization)
-        tokenized_corpus = [doc["text"].lower().split() for doc in documents]
+        tokenized_corpus = [_tokenize(doc["text"]) for doc in documents]
         
         # Build BM25 index
-        self.bm25_indices[subject] = BM25Okapi(tokenized_corpus)
-        self.corpus_docs[subject] = documents
+        self.bm25_indices[subject] = PostingsBM25(tokenized_corpus)
+        self._search_cache.clear()
+        self.corpus_texts[subject] = [doc["text"] for doc in documents]
+        self.corpus_meta[subject] = [doc["metadata"] for doc in documents]
         
         print(f"Built BM25 index for {subject}: {len(documents)} documents")
     
+    def save_bm25_index(self, subject: str):
+        """
+        Persist a subject's BM25 index and documents to config.BM25_INDEX_DIR
+        
+        Args:
+            subject: Subject name
+        """
+        config.BM25_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": _INDEX_FORMAT_VERSION,
+            "bm25": self.bm25_indices[subject],
+            "texts": self.corpus_texts[subject],
+            "metadatas": self.corpus_meta[subject]
+        }
+        _dump_index(_bm25_index_path(subject), payload)
+    
+    def load_bm25_index(self, subject: str) -> bool:
+        """
+        Load a subject's persisted BM25 index
+        
+        Args:
+            subject: Subject name
+            
+        Returns:
+            True if an up-to-date index was found and loaded, False otherwise
+        """
+        path = _bm25_index_path(subject)
+        if not path.exists():
+            return False
+        if _newest_pdf_mtime(subject) > path.stat().st_mtime:
+            print(f"Warning: PDFs for {subject} changed after its BM25 index was built, re-run ingestion to rebuild it")
+            return False
+        try:
+            payload = _load_index(path)
+        except Exception as e:
+            print(f"Warning: Could not read BM25 index for {subject} ({e}), re-run ingestion to rebuild it")
+            return False
+        if payload.get("version") != _INDEX_FORMAT_VERSION:
+            print(f"Warning: BM25 index for {subject} is outdated, re-run ingestion to rebuild it")
+            return False
+        self.bm25_indices[subject] = payload["bm25"]
+        self._search_cache.clear()
+        self.corpus_texts[subject] = payload["texts"]
+        self.corpus_meta[subject] = payload["metadatas"]
+        return True
+    
+    def load_bm25_indices(self, subjects: List[str] = config.SUBJECTS) -> List[str]:
+        """
+        Load every persisted BM25 index
+        
+        Args:
+            subjects: Subjects to load
+            
+        Returns:
+            Subjects whose index was loaded
+        """
+        return [subject for subject in subjects if self.load_bm25_index(subject)]
+    
     def bm25_search(self, query: str, subject: str, top_k: int) -> List[Dict]:
         """
         Perform BM25 search for a subject
@@ -60,23 +202,29 @@ class HybridRetriever:
             return []
         
         # Tokenize query
-        tokenized_query = query.lower().split()
+        tokenized_query = _tokenize(query)
         
         # Get BM25 scores
         bm25_scores = self.bm25_indices[subject].get_scores(tokenized_query)
         
-        # Get top-k indices
-        top_indices = np.argsort(bm25_scores)[::-1][:top_k]
+        # Get top-k indices: O(N) partition, then sort only the k survivors
+        if top_k < len(bm25_scores):
+            top_indices = np.argpartition(-bm25_scores, top_k)[:top_k]
+        else:
+            top_indices = np.arange(len(bm25_scores))
+        top_indices = top_indices[np.argsort(-bm25_scores[top_indices])]
         
-        # Format results
-        results = []
-        for idx in top_indices:
-            if bm25_scores[idx] > 0:  # Only include non-zero scores
-                doc = self.corpus_docs[subject][idx].copy()
-                doc["bm25_score"] = float(bm25_scores[idx])
-                results.append(doc)
+        # Only include non-zero scores, filtered and converted in one pass each
+        top_scores = bm25_scores[top_indices]
+        mask = top_scores > 0
         
-        return results
+        # Format results, gathering text and metadata of the hits only
+        texts = self.corpus_texts[subject]
+        metas = self.corpus_meta[subject]
+        return [
+            {"text": texts[idx], "metadata": metas[idx], "bm25_score": score}
+            for idx, score in zip(top_indices[mask].tolist(), top_scores[mask].tolist())
+        ]
     
     def reciprocal_rank_fusion(
         self,
@@ -95,22 +243,22 @@ class HybridRetriever:
         Returns:
             Fused and ranked results
         """
-        # Create a score map: doc_text -> RRF score
+        # Create a score map: doc id -> RRF score
         rrf_scores = defaultdict(float)
         doc_map = {}  # Store full document info
         
         # Add BM25 scores (weighted)
         for rank, doc in enumerate(bm25_results, 1):
-            doc_text = doc["text"]
-            rrf_scores[doc_text] += config.HYBRID_SEARCH_WEIGHTS["bm25"] * (1 / (k + rank))
-            doc_map[doc_text] = doc
+            key = _doc_key(doc)
+            rrf_scores[key] += config.HYBRID_SEARCH_WEIGHTS["bm25"] * (1 / (k + rank))
+            doc_map[key] = doc
         
         # Add semantic scores (weighted)
         for rank, doc in enumerate(semantic_results, 1):
-            doc_text = doc["text"]
-            rrf_scores[doc_text] += config.HYBRID_SEARCH_WEIGHTS["semantic"] * (1 / (k + rank))
-            if doc_text not in doc_map:
-                doc_map[doc_text] = doc
+            key = _doc_key(doc)
+            rrf_scores[key] += config.HYBRID_SEARCH_WEIGHTS["semantic"] * (1 / (k + rank))
+            if key not in doc_map:
+                doc_map[key] = doc
         
         # Sort by RRF score
         sorted_docs = sorted(
@@ -120,13 +268,7 @@ class HybridRetriever:
         )
         
         # Format results
-        results = []
-        for doc_text, score in sorted_docs:
-            doc = doc_map[doc_text].copy()
-            doc["hybrid_score"] = score
-            results.append(doc)
-        
-        return results
+        return [{**doc_map[key], "hybrid_score": score} for key, score in sorted_docs]
     
     def search(
         self,
@@ -137,6 +279,9 @@ class HybridRetriever:
         """
         Perform hybrid search (BM25 + semantic)
         
+        Results of recent searches are cached, by exact query text and by query
+        embedding similarity, and returned again for repeated questions.
+        
         Args:
             query: Search query
             subject: Subject to filter by
@@ -145,16 +290,40 @@ class HybridRetriever:
         Returns:
             List of top-k documents ranked by hybrid score
         """
-        # Retrieve more results for fusion
-        retrieve_k = top_k * 2
+        key = (" ".join(query.split()), subject, top_k)
+        if key in self._search_cache:
+            self._search_cache.move_to_end(key)
+            return list(self._search_cache[key][1])
         
-        # Get BM25 results
-        bm25_results = self.bm25_search(query, subject, retrieve_k)
+        # Near-duplicate of a recent question: reuse its results. The embedding is
+        # cached by the vector store, so a miss does not encode the query twice
+        query_embedding = self.vector_store.encode_queries([query])[0]
+        similar = [(k, entry) for k, entry in self._search_cache.items() if k[1:] == key[1:]]
+        if similar:
+            similarities = np.stack([entry[0] for _, entry in similar]) @ query_embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= config.SEMANTIC_CACHE_THRESHOLD:
+                self._search_cache.move_to_end(similar[best][0])
+                return list(similar[best][1][1])
+        
+        results = self._hybrid_search(query, subject, top_k)
+        self._search_cache[key] = (query_embedding, results)
+        while len(self._search_cache) > config.SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+        return list(results)
+    
+    def _hybrid_search(self, query: str, subject: str, top_k: int) -> List[Dict]:
+        """Run BM25 and semantic search, fuse them and optionally rerank (uncached)"""
+        # Retrieve more results for fusion (and more still when reranking)
+        retrieve_k = top_k * 4 if self.reranker is not None else top_k * 2
         
-        # Get semantic results
-        semantic_results = self.vector_store.semantic_search(
-            query, subject, retrieve_k
+        # Run the two branches concurrently: semantic search on the shared
+        # executor, BM25 on this thread (numpy, torch and Chroma release the GIL)
+        semantic_future = _SEARCH_EXECUTOR.submit(
+            self.vector_store.semantic_search, query, subject, retrieve_k
         )
+        bm25_results = self.bm25_search(query, subject, retrieve_k)
+        semantic_results = semantic_future.result()
         
         # Fuse results
         hybrid_results = self.reciprocal_rank_fusion(
@@ -162,10 +331,111 @@ class HybridRetriever:
             semantic_results
         )
         
+        # Rerank the best fused candidates with the cross-encoder
+        if self.reranker is not None:
+            candidates = hybrid_results[:config.RERANK_CANDIDATES]
+            return self.reranker.rerank(query, candidates, top_k)
+        
         # Return top-k
         return hybrid_results[:top_k]
 
 
+def _tokenize(text: str) -> List[str]:
+    """Split text into BM25 terms; used for both the corpus and queries so they match"""
+    return text.lower().translate(_AR_NORMALIZE).split()
+
+
+def _doc_key(doc: Dict) -> tuple:
+    """Identify a chunk by the same fields as its Chroma ID, without hashing its text"""
+    meta = doc["metadata"]
+    return (meta["subject"], meta["filename"], meta["chunk_id"])
+
+
+def _bm25_index_path(subject: str) -> Path:
+    return config.BM25_INDEX_DIR / f"{subject}.idx"
+
+
+def _newest_pdf_mtime(subject: str) -> float:
+    """Modification time of the most recently changed PDF of a subject (0 if none)"""
+    subject_dir = config.DATA_DIR / subject
+    if not subject_dir.exists():
+        return 0.0
+    return max((pdf.stat().st_mtime for pdf in subject_dir.glob("*.pdf")), default=0.0)
+
+
+def _dump_index(path: Path, obj: Any):
+    """
+    Write obj with pickle protocol 5, storing numpy buffers out-of-band
+    
+    Layout: buffer count and payload size, each buffer's size, the pickle payload,
+    then the raw buffers. The postings arrays are written as plain bytes, not pickled.
+    """
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    raws = [buf.raw() for buf in buffers]
+    # Write next to the target and rename, so a crash never leaves a truncated index behind
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<IQ", len(raws), len(payload)))
+        f.write(struct.pack(f"<{len(raws)}Q", *(raw.nbytes for raw in raws)))
+        f.write(payload)
+        for raw in raws:
+            f.write(raw)
+    os.replace(tmp_path, path)
+
+
+def _load_index(path: Path) -> Any:
+    """
+    Read a file written by _dump_index; arrays are rebuilt on the read buffers without a copy
+    
+    Raises:
+        ValueError: If the file is shorter or longer than its header says
+    """
+    file_size = path.stat().st_size
+    with open(path, "rb") as f:
+        n_buffers, payload_size = struct.unpack("<IQ", _read_exact(f, struct.calcsize("<IQ")))
+        sizes_format = f"<{n_buffers}Q"
+        if struct.calcsize("<IQ") + 8 * n_buffers > file_size:
+            raise ValueError("index file is truncated")
+        sizes = struct.unpack(sizes_format, _read_exact(f, struct.calcsize(sizes_format)))
+        expected_size = struct.calcsize("<IQ") + struct.calcsize(sizes_format) + payload_size + sum(sizes)
+        if file_size != expected_size:
+            raise ValueError(f"index file is {file_size} bytes, header expects {expected_size}")
+        payload = _read_exact(f, payload_size)
+        buffers = []
+        for size in sizes:
+            buf = bytearray(size)
+            if f.readinto(buf) != size:
+                raise ValueError("index file is truncated")
+            buffers.append(buf)
+    return pickle.loads(payload, buffers=buffers)
+
+
+def _read_exact(f, size: int) -> bytes:
+    """Read exactly size bytes from f, failing on a short read"""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("index file is truncated")
+    return data
+
+
+def build_and_save_bm25_index(subject: str, documents: List[Dict]) -> str:
+    """
+    Build and persist one subject's BM25 index (module-level so worker processes can run it)
+    
+    Args:
+        subject: Subject name
+        documents: List of document dicts with 'text' and 'metadata'
+        
+    Returns:
+        The subject name
+    """
+    retriever = HybridRetriever(vector_store=None)
+    retriever.build_bm25_index(subject, documents)
+    retriever.save_bm25_index(subject)
+    return subject
+
+
 if __name__ == "__main__":
     # Testing code would go here
     print("Hybrid retriever module loaded")
@@ -1,10 +1,44 @@
 """
 Ollama LLM client for question answering, quiz generation, and explanations
 """
+import re
+import httpx
 import ollama
 from typing import List, Dict, Optional
 from . import config
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+
+# Arabic letters, presentation forms included; counted separately when estimating tokens
+_RE_ARABIC_CHAR = re.compile(r'[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the prompt tokens of a text from its Arabic and other character counts"""
+    arabic = len(_RE_ARABIC_CHAR.findall(text))
+    return arabic // config.ARABIC_CHARS_PER_TOKEN + (len(text) - arabic) // config.CHARS_PER_TOKEN
+
+
+def fit_token_budget(context_docs: List[Dict]) -> List[Dict]:
+    """
+    Keep the leading documents that fit in the context token budget
+    
+    Documents arrive best first, so the least relevant ones are dropped. The
+    first document is always kept, even if it alone exceeds the budget.
+    """
+    used = 0
+    for i, doc in enumerate(context_docs):
+        used += estimate_tokens(doc["text"])
+        if used > config.MAX_CONTEXT_TOKENS and i > 0:
+            return context_docs[:i]
+    return context_docs
+
 
 class OllamaClient:
     """Client for interacting with Ollama LLM"""
@@ -13,10 +47,36 @@ class OllamaClient:
         """Initialize Ollama client"""
         self.model = config.OLLAMA_MODEL
         self.client = ollama.Client(host=config.OLLAMA_BASE_URL)
+        # Streaming talks to the HTTP API directly so each chunk is parsed with orjson
+        self._http = httpx.Client(base_url=config.OLLAMA_BASE_URL, timeout=None)
+        
+        # Static parts of the prompt for each mode, built once instead of per call
+        self._prefix = {
+            "ask": config.SYSTEM_PROMPT_QA,
+            "quiz": config.SYSTEM_PROMPT_QUIZ,
+            "explain": config.SYSTEM_PROMPT_EXPLAIN
+        }
+        self._suffix = {
+            "ask": "\n\n--- Student Question ---\n{query}",
+            "quiz": (
+                "\n\n--- Instructions ---\n"
+                "قم بإنشاء 5 أسئلة اختيار من متعدد بناءً على المحتوى أعلاه.\n"
+                "لكل سؤال، قدم 4 خيارات (A, B, C, D) واذكر الإجابة الصحيحة.\n\n"
+                "Create 5 multiple choice questions based on the content above.\n"
+                "For each question, provide 4 options (A, B, C, D) and indicate the correct answer."
+            ),
+            "explain": (
+                "\n\n--- Topic to Explain ---\n{query}\n\n"
+                "اشرح هذا الموضوع بطريقة واضحة ومبسطة مع أمثلة.\n"
+                "Explain this topic clearly and simply with examples."
+            )
+        }
         
-        # Verify model is available
+        # Verify model is available, remembering the installed models for later checks
+        self._available_models = set()
         try:
-            self.client.list()
+            models = self.client.list()
+            self._available_models = {model["name"] for model in models.get("models", [])}
             print(f"Connected to Ollama. Using model: {self.model}")
         except Exception as e:
             print(f"Warning: Could not connect to Ollama: {e}")
@@ -41,48 +101,24 @@ class OllamaClient:
         Returns:
             Complete prompt string
         """
+        if mode not in self._prefix:
+            mode = "ask"
+        
         # Build context from retrieved documents
-        context_text = "\n\n".join([
+        context_text = "\n\n".join(
             f"[مصدر {i+1}]\n{doc['text']}"
-            for i, doc in enumerate(context_docs)
-        ])
-        
-        # Select system prompt based on mode
-        system_prompts = {
-            "ask": config.SYSTEM_PROMPT_QA,
-            "quiz": config.SYSTEM_PROMPT_QUIZ,
-            "explain": config.SYSTEM_PROMPT_EXPLAIN
-        }
-        system_prompt = system_prompts.get(mode, config.SYSTEM_PROMPT_QA)
-        
-        # Build full prompt
-        prompt_parts = [system_prompt]
-        
-        if conversation_history:
-            prompt_parts.append(f"\n--- Previous Conversation ---\n{conversation_history}")
-        
-        if context_text:
-            prompt_parts.append(f"\n--- Reference Content ---\n{context_text}")
+            for i, doc in enumerate(fit_token_budget(context_docs))
+        )
         
-        # Add specific instructions based on mode
-        if mode == "quiz":
-            prompt_parts.append(
-                "\n--- Instructions ---\n"
-                "قم بإنشاء 5 أسئلة اختيار من متعدد بناءً على المحتوى أعلاه.\n"
-                "لكل سؤال، قدم 4 خيارات (A, B, C, D) واذكر الإجابة الصحيحة.\n\n"
-                "Create 5 multiple choice questions based on the content above.\n"
-                "For each question, provide 4 options (A, B, C, D) and indicate the correct answer."
-            )
-        elif mode == "explain":
-            prompt_parts.append(
-                f"\n--- Topic to Explain ---\n{query}\n\n"
-                "اشرح هذا الموضوع بطريقة واضحة ومبسطة مع أمثلة.\n"
-                "Explain this topic clearly and simply with examples."
-            )
-        else:  # ask mode
-            prompt_parts.append(f"\n--- Student Question ---\n{query}")
+        history_block = f"\n\n--- Previous Conversation ---\n{conversation_history}" if conversation_history else ""
+        context_block = f"\n\n--- Reference Content ---\n{context_text}" if context_text else ""
         
-        return "\n".join(prompt_parts)
+        return "".join((
+            self._prefix[mode],
+            history_block,
+            context_block,
+            self._suffix[mode].format(query=query)
+        ))
     
     def generate_response(
         self,
@@ -114,21 +150,35 @@ class OllamaClient:
             if stream:
                 # Stream response
                 response_text = ""
-                stream_response = self.client.chat(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    stream=True,
-                    options={
+                payload = {
+                    "model": self.model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "stream": True,
+                    "options": {
                         "temperature": config.OLLAMA_TEMPERATURE,
                         "num_predict": config.OLLAMA_MAX_TOKENS
                     }
-                )
+                }
                 
-                for chunk in stream_response:
-                    if "message" in chunk and "content" in chunk["message"]:
-                        content = chunk["message"]["content"]
-                        print(content, end="", flush=True)
-                        response_text += content
+                with self._http.stream("POST", "/api/chat", json=payload) as stream_response:
+                    if stream_response.is_error:
+                        # Ollama explains failures (e.g. a model that is not pulled) in a JSON body
+                        stream_response.read()
+                        try:
+                            message = _json_loads(stream_response.content).get("error")
+                        except (ValueError, AttributeError):  # Not a JSON object
+                            message = None
+                        raise RuntimeError(message or stream_response.text or f"HTTP {stream_response.status_code}")
+                    for line in stream_response.iter_lines():
+                        if not line:
+                            continue
+                        chunk = _json_loads(line)
+                        if "error" in chunk:
+                            raise RuntimeError(chunk["error"])
+                        content = chunk.get("message", {}).get("content")
+                        if content:
+                            print(content, end="", flush=True)
+                            response_text += content
                 
                 print()  # New line after streaming
                 return response_text
@@ -155,16 +205,13 @@ class OllamaClient:
         """
         Check if the configured model is available
         
+        Uses the model list fetched when the client was created, so no extra
+        request is sent to Ollama.
+        
         Returns:
             True if model is available, False otherwise
         """
-        try:
-            models = self.client.list()
-            model_names = [model["name"] for model in models.get("models", [])]
-            return self.model in model_names
-        except Exception as e:
-            print(f"Error checking model availability: {e}")
-            return False
+        return self.model in self._available_models
 
 
 if __name__ == "__main__":
@@ -0,0 +1,46 @@
+"""
+Cross-encoder reranking of hybrid retrieval candidates
+"""
+from sentence_transformers import CrossEncoder
+from typing import List, Dict
+from . import config
+
+
+class CrossEncoderReranker:
+    """Re-scores retrieved documents by encoding each (query, document) pair jointly"""
+    
+    def __init__(self, model_name: str = config.RERANKER_MODEL):
+        """
+        Load the cross-encoder model
+        
+        Args:
+            model_name: Hugging Face model name of the cross-encoder
+        """
+        print("Loading reranker model...")
+        self.model = CrossEncoder(model_name)
+        print("Reranker model loaded successfully")
+    
+    def rerank(self, query: str, documents: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Rerank candidate documents for a query
+        
+        Args:
+            query: Search query
+            documents: Candidate documents with 'text' and 'metadata'
+            top_k: Number of documents to return
+            
+        Returns:
+            Top-k documents ordered by cross-encoder score, with 'rerank_score' added
+        """
+        if not documents:
+            return []
+        
+        # One batched forward pass over all pairs
+        scores = self.model.predict(
+            [(query, doc["text"]) for doc in documents],
+            batch_size=config.RERANK_BATCH_SIZE
+        )
+        
+        ranked = sorted(zip(documents, scores), key=lambda x: x[1], reverse=True)
+        
+        return [{**doc, "rerank_score": float(score)} for doc, score in ranked[:top_k]]
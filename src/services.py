@@ -0,0 +1,27 @@
+"""
+Process-wide shared instances of the heavy RAG components
+"""
+import functools
+from typing import Optional
+from . import config
+from .vector_store import VectorStore
+from .hybrid_retriever import HybridRetriever
+from .reranker import CrossEncoderReranker
+
+
+@functools.cache
+def get_vector_store() -> VectorStore:
+    """Get the shared VectorStore (Chroma client + embedding model)"""
+    return VectorStore()
+
+
+@functools.cache
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Get the shared cross-encoder reranker, or None when reranking is disabled"""
+    return CrossEncoderReranker() if config.USE_RERANKER else None
+
+
+@functools.cache
+def get_retriever() -> HybridRetriever:
+    """Get the shared HybridRetriever built on the shared VectorStore"""
+    return HybridRetriever(get_vector_store(), reranker=get_reranker())
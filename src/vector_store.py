@@ -2,12 +2,33 @@
 ChromaDB vector store for semantic search with subject filtering
 """
 import chromadb
+import torch
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Optional
+from collections import OrderedDict
+import numpy as np
 from . import config
 
 
+# Shared by every VectorStore in the process so the model is only loaded once
+_EMBEDDER: Optional[SentenceTransformer] = None
+
+
+def _get_embedder() -> SentenceTransformer:
+    """Load the embedding model on first use and reuse it afterwards"""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Loading embedding model on {device}...")
+        _EMBEDDER = SentenceTransformer(config.EMBEDDING_MODEL, device=device)
+        if device == "cuda":
+            _EMBEDDER.half()  # FP16 runs the transformer on tensor cores at half the memory
+        _EMBEDDER.encode(["warmup"])  # Pay one-time kernel selection / allocation before the first query
+        print("Embedding model loaded successfully")
+    return _EMBEDDER
+
+
 class VectorStore:
     """ChromaDB-based vector store with subject metadata filtering"""
     
@@ -22,15 +43,53 @@ class VectorStore:
             )
         )
         
-        # Initialize embedding model (supports Arabic and English)
-        print("Loading embedding model...")
-        self.embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
-        print("Embedding model loaded successfully")
+        # Embedding model (supports Arabic and English), shared across instances
+        self.embedding_model = _get_embedder()
+        self._query_cache = OrderedDict()  # Normalized query text -> embedding (LRU)
         
         # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=config.CHROMA_COLLECTION_NAME,
-            metadata={"description": "Thanaweya Amma educational content"}
+        self.collection = self._get_or_create_collection()
+    
+    def _get_or_create_collection(self):
+        """Get the collection, creating it with the configured HNSW settings if needed"""
+        try:
+            collection = self.client.get_collection(name=config.CHROMA_COLLECTION_NAME)
+        except ValueError:  # Collection does not exist yet
+            return self.client.create_collection(
+                name=config.CHROMA_COLLECTION_NAME,
+                metadata={
+                    "description": "Thanaweya Amma educational content",
+                    **config.CHROMA_HNSW_SETTINGS
+                }
+            )
+        
+        # HNSW settings are fixed when a collection is created, so an existing one keeps its
+        # old index. Its metadata is left untouched so it keeps describing that index
+        settings = collection.metadata or {}
+        if any(settings.get(key) != value for key, value in config.CHROMA_HNSW_SETTINGS.items()):
+            print("Warning: Existing collection was created with different HNSW settings; "
+                  "reset it and re-run ingest_data.py to apply the new ones")
+        return collection
+    
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode document texts in large batches
+        
+        Args:
+            texts: Document texts to encode
+            
+        Returns:
+            Array of normalized embeddings, one row per text
+        """
+        # encode() already sorts texts by length before batching (and restores the
+        # input order), so batches are padded to near-uniform lengths without a
+        # separate bucketing pass here
+        return self.embedding_model.encode(
+            texts,
+            batch_size=config.EMBEDDING_BATCH_SIZE,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
         )
     
     def add_documents(self, documents: List[Dict]):
@@ -44,35 +103,74 @@ class VectorStore:
             print("No documents to add")
             return
         
+        print(f"Generating embeddings for {len(documents)} documents...")
+        embeddings = self.embed_documents([doc["text"] for doc in documents])
+        self.add_precomputed(documents, embeddings)
+    
+    def add_precomputed(self, documents: List[Dict], embeddings: np.ndarray):
+        """
+        Add documents whose embeddings were already computed
+        
+        Args:
+            documents: List of document dicts with 'text' and 'metadata' keys
+            embeddings: Array with one embedding row per document
+        """
+        if not documents:
+            print("No documents to add")
+            return
+        
         texts = [doc["text"] for doc in documents]
         metadatas = [doc["metadata"] for doc in documents]
         
-        # Generate embeddings
-        print(f"Generating embeddings for {len(texts)} documents...")
-        embeddings = self.embedding_model.encode(
-            texts,
-            show_progress_bar=True,
-            convert_to_numpy=True
-        ).tolist()
-        
         # Create unique IDs
         ids = [f"{meta['subject']}_{meta['filename']}_{meta['chunk_id']}" 
                for meta in metadatas]
         
-        # Add to ChromaDB in batches
-        batch_size = 100
+        # Add to ChromaDB in large shards
+        batch_size = config.CHROMA_INSERT_BATCH_SIZE
         for i in range(0, len(documents), batch_size):
             batch_end = min(i + batch_size, len(documents))
             
             self.collection.add(
                 ids=ids[i:batch_end],
-                embeddings=embeddings[i:batch_end],
+                embeddings=embeddings[i:batch_end].tolist(),
                 documents=texts[i:batch_end],
                 metadatas=metadatas[i:batch_end]
             )
         
         print(f"Added {len(documents)} documents to ChromaDB")
     
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode search queries in one batch, reusing cached embeddings of repeated queries
+        
+        Args:
+            queries: Query strings
+            
+        Returns:
+            Array of normalized query embeddings, one row per query
+        """
+        if not queries:
+            return np.empty((0, config.EMBEDDING_DIMENSION), dtype=np.float32)
+        
+        keys = [" ".join(query.split()) for query in queries]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._query_cache]
+        if missing:
+            embeddings = self.embedding_model.encode(
+                missing,
+                batch_size=32,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            self._query_cache.update(zip(missing, embeddings))
+        
+        result = np.stack([self._query_cache[key] for key in keys])
+        for key in keys:
+            self._query_cache.move_to_end(key)
+        while len(self._query_cache) > config.QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return result
+    
     def semantic_search(
         self,
         query: str,
@@ -90,31 +188,62 @@ class VectorStore:
         Returns:
             List of relevant documents with metadata and scores
         """
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(
-            [query],
-            convert_to_numpy=True
-        ).tolist()[0]
-        
-        # Search with subject filter
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            where={"subject": subject}  # Filter by subject metadata
-        )
+        return self.semantic_search_batch([query], [subject], top_k)[0]
+    
+    def semantic_search_batch(
+        self,
+        queries: List[str],
+        subjects: List[str],
+        top_k: int = config.TOP_K_RETRIEVAL
+    ) -> List[List[Dict]]:
+        """
+        Perform semantic search for several queries at once
+        
+        All queries are embedded in one encoder call, and queries that share a
+        subject go to Chroma in a single query call.
+        
+        Args:
+            queries: Search queries
+            subjects: Subject to filter by, one per query
+            top_k: Number of results to return per query
+            
+        Returns:
+            One list of relevant documents (with metadata and scores) per query
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self.encode_queries(queries).tolist()
         
-        # Format results
-        documents = []
-        if results["documents"] and results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
-                documents.append({
-                    "text": doc,
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i],
-                    "score": 1 / (1 + results["distances"][0][i])  # Convert distance to similarity score
-                })
-        
-        return documents
+        # Group query positions by subject
+        by_subject = {}
+        for i, subject in enumerate(subjects):
+            by_subject.setdefault(subject, []).append(i)
+        
+        all_documents = [[] for _ in queries]
+        for subject, positions in by_subject.items():
+            # Search with subject filter
+            results = self.collection.query(
+                query_embeddings=[query_embeddings[i] for i in positions],
+                n_results=top_k,
+                where={"subject": subject}  # Filter by subject metadata
+            )
+            
+            # Format results
+            for row, i in enumerate(positions):
+                if not results["documents"] or not results["documents"][row]:
+                    continue
+                distances = np.asarray(results["distances"][row], dtype=np.float32)
+                scores = 1.0 / (1.0 + distances)  # Convert distance to similarity score
+                all_documents[i] = [
+                    {"text": text, "metadata": meta, "distance": float(dist), "score": float(score)}
+                    for text, meta, dist, score in zip(
+                        results["documents"][row], results["metadatas"][row],
+                        distances.tolist(), scores.tolist()
+                    )
+                ]
+        
+        return all_documents
     
     def get_collection_stats(self) -> Dict:
         """Get statistics about the collection"""
@@ -127,10 +256,7 @@ class VectorStore:
     def reset_collection(self):
         """Reset (delete) the collection - use with caution!"""
         self.client.delete_collection(config.CHROMA_COLLECTION_NAME)
-        self.collection = self.client.get_or_create_collection(
-            name=config.CHROMA_COLLECTION_NAME,
-            metadata={"description": "Thanaweya Amma educational content"}
-        )
+        self.collection = self._get_or_create_collection()
         print("Collection reset successfully")
 
 